@@ -0,0 +1,67 @@
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+OP_CODES = {">": 0, "<": 1, "=": 2}
+
+# на небольших массивах запуск потоков numba дороже самого сравнения
+NUMBA_MIN_SIZE = 1 << 20
+# Python int numba типизирует как int64: значение вне этого диапазона он не примет
+_NUMBA_INT_RANGE = (int(np.iinfo(np.int64).min), int(np.iinfo(np.int64).max))
+
+
+@lru_cache(maxsize=None)
+def _numba_filters() -> Optional[Tuple[Callable, Callable, Callable]]:
+    """Импортирует numba и определяет ядра при первом большом массиве: сам импорт numba занимает ~250 мс"""
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True, cache=True)
+    def filter_gt(arr, value, mask):
+        for i in prange(arr.size):
+            mask[i] = arr[i] > value
+
+    @njit(parallel=True, cache=True)
+    def filter_lt(arr, value, mask):
+        for i in prange(arr.size):
+            mask[i] = arr[i] < value
+
+    @njit(parallel=True, cache=True)
+    def filter_eq(arr, value, mask):
+        for i in prange(arr.size):
+            mask[i] = arr[i] == value
+
+    return filter_gt, filter_lt, filter_eq
+
+
+_OP_SYMBOLS = ('>', '<', '==')
+_FILTER_CACHE: Dict[Tuple[str, int], Callable] = {}
+
+
+def _specialized_filter(dtype: np.dtype, op_code: int) -> Callable:
+    """Генерирует и кэширует функцию сравнения под конкретную пару (dtype, оператор)"""
+    key = (dtype.str, op_code)
+    func = _FILTER_CACHE.get(key)
+    if func is None:
+        namespace = {}
+        exec(f"def f(a, v): return a {_OP_SYMBOLS[op_code]} v", namespace)
+        func = _FILTER_CACHE[key] = namespace['f']
+    return func
+
+
+def _numba_accepts(value: Union[int, float, str]) -> bool:
+    return not isinstance(value, int) or _NUMBA_INT_RANGE[0] <= value <= _NUMBA_INT_RANGE[1]
+
+
+def filter_mask(arr: np.ndarray, op_code: int, value: Union[int, float, str]) -> np.ndarray:
+    """Возвращает булеву маску arr <op> value, для больших числовых массивов через numba"""
+    if (arr.dtype.kind in 'iuf' and arr.size >= NUMBA_MIN_SIZE and _numba_accepts(value)
+            and (numba_filters := _numba_filters()) is not None):
+        mask = np.empty(arr.size, dtype=np.bool_)
+        numba_filters[op_code](arr, value, mask)
+        return mask
+
+    return _specialized_filter(arr.dtype, op_code)(arr, value)
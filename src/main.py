@@ -1,27 +1,50 @@
 import argparse
-import re
-from typing import Tuple
+import sys
+from typing import List, Tuple
 from tabulate import tabulate
 
 from processor import CSVProcessor
 
 
+CONDITION_OPERATORS = frozenset('<>=')
+# больше строк tabulate выводит слишком долго, такие результаты печатаем как CSV
+LARGE_RESULT_ROWS = 1000
+
+
 def parse_conditions(condition: str) -> Tuple[str, str, str]:
-    match = re.match(r'^([^<>=]+?)([<>=])(.+)$', condition)
-    if not match:
-        raise ValueError(f"Invalid condition format: {condition}")
+    for i, operator in enumerate(condition):
+        if operator in CONDITION_OPERATORS:
+            if 0 < i < len(condition) - 1:
+                return condition[:i].strip(), operator, condition[i + 1:].strip()
+            break
 
-    column = match.group(1).strip()
-    operator = match.group(2)
-    value = match.group(3).strip()
+    raise ValueError(f"Invalid condition format: {condition}")
 
-    return column, operator, value
+
+def parse_where(where: str) -> List[Tuple[str, str, str]]:
+    conditions: List[str] = []
+    for part in where.split('&'):
+        # '&' внутри значения (brand=AT&T) условия не разделяет: часть без оператора продолжает предыдущую
+        if conditions and not _is_condition(part):
+            conditions[-1] += '&' + part
+        else:
+            conditions.append(part)
+
+    return [parse_conditions(condition) for condition in conditions]
+
+
+def _is_condition(text: str) -> bool:
+    try:
+        parse_conditions(text)
+    except ValueError:
+        return False
+    return True
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description='CSV file processor')
     parser.add_argument('file', help='Path to the CSV file')
-    parser.add_argument('--where', help='Filter condition, e.g., price>100')
+    parser.add_argument('--where', help='Filter condition, e.g., price>100 or "price>100 & rating>4.5"')
     parser.add_argument('--aggregate', help='Aggregation, e.g., price=avg')
     parser.add_argument('--order-by', help='Sorting, e.g., price=desc or name=asc')
 
@@ -32,29 +55,31 @@ def main() -> None:
         return
 
     try:
-        processor = CSVProcessor(args.file)
-        result_data = processor.data
-
-        if args.where:
-            column, operator, value = parse_conditions(args.where)
-            result_data = processor.filter_data(column, operator, value)
-            processor.data = result_data
+        conditions = parse_where(args.where) if args.where else []
 
         if args.aggregate:
             column, _, function = parse_conditions(args.aggregate)
-            aggregated_result = processor.aggregate_data(column, function)
+            aggregated_result = CSVProcessor.stream_aggregate(args.file, conditions, column, function)
             return print(tabulate([{f"{column}_{function}": aggregated_result}], headers="keys", tablefmt="grid"))
 
+        if conditions:
+            processor = CSVProcessor.stream_filter(args.file, conditions)
+        else:
+            processor = CSVProcessor(args.file)
+
         if args.order_by:
             column, _, direction = parse_conditions(args.order_by)
             if direction not in ['asc', 'desc']:
                 raise ValueError(f"Sort direction must be 'asc' or 'desc', got: {direction}")
-            result_data = processor.sort_data(column, direction)
+            processor.order_by(column, direction)
 
-        if result_data:
-            print(tabulate(result_data, headers="keys", tablefmt="grid"))
-        else:
+        if not processor.row_count:
             print("No data to display")
+        elif processor.row_count > LARGE_RESULT_ROWS:
+            sys.stdout.flush()
+            processor.write_csv(sys.stdout.buffer)
+        else:
+            print(tabulate(processor.to_rows(), headers="keys", tablefmt="grid"))
 
     except FileNotFoundError:
         print(f"Error: File '{args.file}' not found")
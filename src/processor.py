@@ -1,39 +1,393 @@
 import csv
-from typing import List, Dict, Union, Optional, Callable, Any
+import io
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import List, Dict, Union, Optional, Callable, Any, Tuple, Iterator, Iterable, BinaryIO
+
+import numpy as np
+
+from kernels import OP_CODES, filter_mask
+
+try:
+    import pyarrow as pa
+    from pyarrow import compute as pc
+    from pyarrow import csv as pa_csv
+except ImportError:
+    pa = None
+    pc = None
+    pa_csv = None
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
 
 
 class CSVProcessor:
-    OPERATORS = {
-        ">": lambda x, y: x > y,
-        "<": lambda x, y: x < y,
-        "=": lambda x, y: x == y
-    }
-
-    AGGREGATORS = {
-        'avg': lambda values: sum(values) / len(values),
-        'min': min,
-        'max': max,
-    }
-
-    def __init__(self, filename: str) -> None:
+    AGG_CODES = {'avg': 0, 'min': 1, 'max': 2}
+    # среднее копим в float64: после сужения колонка может оказаться float32
+    AGG_NP = (partial(np.mean, dtype=np.float64), np.min, np.max)
+    NUMEXPR_OPS = {">": ">", "<": "<", "=": "=="}
+
+    READ_BLOCK_SIZE = 8 << 20
+    BATCH_SIZE = 64_000
+    FILE_BUFFER_SIZE = 1 << 20
+    TYPE_SAMPLE_SIZE = 64
+    WIDER_TYPE = {int: float, float: str}
+    INT_DTYPES = (np.uint8, np.int8, np.uint16, np.int16, np.uint32, np.int32)
+    # символы, из-за которых csv.writer берёт поле в кавычки
+    QUOTED_CHARS = '[,"\r\n]'
+    SCHEMA_SUFFIX = '.schema.json'
+    TYPES_BY_NAME = {'int': int, 'float': float, 'str': str}
+
+    def __init__(self, filename: str, columns_data: Optional[Dict[str, np.ndarray]] = None,
+                 column_types: Optional[Dict[str, type]] = None) -> None:
         self.filename = filename
-        self.data = CSVProcessor._load_csv(filename)
-        self.columns: List[str] = list(self.data[0].keys()) if self.data else []
-        self.cache_type: Dict[str, Optional[type]] = {i: None for i in self.columns}
+        # схему сохраняем для целого файла, прочитанного без pyarrow (у pyarrow типы уже известны);
+        # порции её не пишут, при потоковой обработке типы сохраняет _settle_types
+        self._schema_path: Optional[str] = None
+        known_types: Dict[str, type] = dict(column_types or {})
+        if columns_data is None:
+            if not CSVProcessor._use_arrow(filename) and os.path.isfile(filename):
+                self._schema_path = filename + self.SCHEMA_SUFFIX
+            columns_data, known_types = CSVProcessor._read_columns(filename)
+            known_types.update(column_types or {})
+        self.columns_data: Dict[str, np.ndarray] = columns_data
+        self.columns: List[str] = list(self.columns_data.keys())
+        self.n_rows = len(self.columns_data[self.columns[0]]) if self.columns else 0
+        self._schema: Dict[str, str] = self._load_schema()
+        self.cache_type: Dict[str, Optional[type]] = {
+            i: known_types.get(i, self.TYPES_BY_NAME.get(self._schema.get(i))) for i in self.columns
+        }
+        self._row_index: Optional[np.ndarray] = None
+
+    @staticmethod
+    def _load_csv(filename: str) -> Dict[str, np.ndarray]:
+        """Читает CSV в колоночное представление: имя колонки -> numpy-массив"""
+        return CSVProcessor._read_columns(filename)[0]
+
+    @staticmethod
+    def _read_columns(filename: str) -> Tuple[Dict[str, np.ndarray], Dict[str, type]]:
+        """Читает колонки и типы, которые уже известны после чтения (их определяет только pyarrow)"""
+        if CSVProcessor._use_arrow(filename):
+            header = CSVProcessor._read_header(filename)
+            if not header:
+                return {}, {}
+            try:
+                # файл отображается в память: парсер pyarrow читает его напрямую, без копий через Python
+                with pa.memory_map(filename) as source:
+                    table = pa_csv.read_csv(
+                        source,
+                        read_options=pa_csv.ReadOptions(block_size=CSVProcessor.READ_BLOCK_SIZE),
+                        convert_options=CSVProcessor._arrow_convert_options(header),
+                    )
+            except pa.ArrowInvalid:
+                # строки другой длины pyarrow не разбирает, а модуль csv дополняет или обрезает их
+                pass
+            else:
+                # колонки независимы, а cast, to_numpy и min/max отпускают GIL, поэтому приводим их параллельно
+                with ThreadPoolExecutor() as executor:
+                    typed = list(executor.map(lambda name: CSVProcessor._typed_text(table.column(name), int),
+                                              table.column_names))
+                columns_data = {name: arr for name, (arr, _) in zip(table.column_names, typed)}
+                return columns_data, {name: column_type for name, (_, column_type) in zip(table.column_names, typed)}
+
+        with open(filename, 'r', encoding='utf-8', newline='', buffering=CSVProcessor.FILE_BUFFER_SIZE) as file:
+            CSVProcessor._advise_sequential(file)
+            reader = csv.reader(file)
+            columns = next(reader, [])
+            return CSVProcessor._columns_from_rows(columns, reader), {}
+
+    @staticmethod
+    def _use_arrow(filename: str) -> bool:
+        # pyarrow отображает файл в память, поэтому каналы и подстановки процессов читаем модулем csv
+        return pa_csv is not None and os.path.isfile(filename)
+
+    @staticmethod
+    def _read_header(filename: str) -> List[str]:
+        with open(filename, 'r', encoding='utf-8', newline='') as file:
+            return next(csv.reader(file), [])
+
+    @staticmethod
+    def _arrow_convert_options(columns: List[str]) -> Any:
+        """Все колонки читаются строками: типы выводим сами, как и без pyarrow (без bool, дат и NaN)"""
+        return pa_csv.ConvertOptions(column_types={name: pa.string() for name in columns})
+
+    @staticmethod
+    def _convert_text(values: Any, column_type: type) -> np.ndarray:
+        """Приводит текстовую колонку (массив pyarrow или object-массив numpy) к column_type.
+
+        Пропущенные поля коротких строк считаются пустыми: числом такая колонка быть не может.
+        """
+        if isinstance(values, np.ndarray):
+            missing = np.equal(values, None) if values.dtype == object else None
+            if missing is None or not missing.any():
+                return values if column_type == str else CSVProcessor._downcast(values.astype(column_type))
+            if column_type != str:
+                raise ValueError("Missing values in a numeric column")
+            return np.where(missing, '', values)
+
+        if values.null_count:
+            if column_type != str:
+                raise ValueError("Missing values in a numeric column")
+            values = pc.fill_null(values, '')
+        if column_type == str:
+            return values.to_numpy(zero_copy_only=False)
+        arrow_type = pa.int64() if column_type == int else pa.float64()
+        try:
+            converted = pc.utf8_trim_whitespace(values).cast(arrow_type)
+        except pa.ArrowInvalid:
+            # '+5' или '1_000' pyarrow не разбирает, а int()/float() принимают: решают они, как и без pyarrow
+            return CSVProcessor._convert_text(values.to_numpy(zero_copy_only=False), column_type)
+        return CSVProcessor._downcast(converted.to_numpy(zero_copy_only=False))
+
+    @staticmethod
+    def _typed_text(values: Any, column_type: type) -> Tuple[np.ndarray, type]:
+        """Приводит текст к column_type, при неудаче расширяя тип int -> float -> str"""
+        while column_type != str:
+            try:
+                return CSVProcessor._convert_text(values, column_type), column_type
+            except ValueError:
+                # pa.ArrowInvalid тоже наследует ValueError
+                column_type = CSVProcessor.WIDER_TYPE[column_type]
+        return CSVProcessor._convert_text(values, str), str
 
     @staticmethod
-    def _load_csv(filename: str) -> List[Dict[str, str]]:
-        with open(filename, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            return list(reader)
+    def _columns_from_rows(columns: List[str], rows: Iterable[List[str]]) -> Dict[str, np.ndarray]:
+        """Транспонирует строки в колонки; короткие строки дополняются None, лишние поля отбрасываются"""
+        rows = [row for row in rows if row]
+        width = len(columns)
+        if any(len(row) != width for row in rows):
+            rows = [(row + [None] * width)[:width] for row in rows]
+
+        values = zip(*rows) if rows else [()] * width
+        return {name: np.array(column_values, dtype=object) for name, column_values in zip(columns, values)}
+
+    @staticmethod
+    def _advise_sequential(file: Any) -> None:
+        """Просит ядро читать файл с упреждением: он читается строго последовательно"""
+        if hasattr(os, 'posix_fadvise'):
+            try:
+                os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            except OSError:
+                # на каналах (pipe) подсказка не поддерживается, а без неё чтение работает так же
+                pass
+
+    @staticmethod
+    def iter_batches(filename: str, batch_size: int = BATCH_SIZE,
+                     column_types: Optional[Dict[str, type]] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """Читает CSV порциями не более batch_size строк, не загружая файл целиком.
+
+        Колонки из column_types приводятся к указанному типу, остальные остаются текстом:
+        выводить тип по одной порции нельзя, в следующих порциях он может оказаться шире.
+        """
+        column_types = column_types or {}
+        for text_columns in CSVProcessor._text_batches(filename, batch_size):
+            yield {
+                name: CSVProcessor._convert_text(values, column_types.get(name, str))
+                for name, values in text_columns.items()
+            }
+
+    @staticmethod
+    def _text_batches(filename: str, batch_size: int,
+                      include_columns: Optional[List[str]] = None) -> Iterator[Dict[str, Any]]:
+        done_rows = 0
+        if CSVProcessor._use_arrow(filename):
+            header = CSVProcessor._read_header(filename)
+            if not header:
+                return
+            convert_options = CSVProcessor._arrow_convert_options(header)
+            if include_columns is not None:
+                convert_options.include_columns = include_columns
+            try:
+                with pa.memory_map(filename) as source:
+                    reader = pa_csv.open_csv(
+                        source,
+                        read_options=pa_csv.ReadOptions(block_size=CSVProcessor.READ_BLOCK_SIZE),
+                        convert_options=convert_options,
+                    )
+                    for record_batch in reader:
+                        for start in range(0, record_batch.num_rows, batch_size):
+                            chunk = record_batch.slice(start, batch_size)
+                            yield {name: chunk.column(i) for i, name in enumerate(chunk.schema.names)}
+                            done_rows += chunk.num_rows
+                return
+            except pa.ArrowInvalid:
+                # строку другой длины pyarrow не разбирает: дочитываем файл модулем csv с того же места
+                pass
+
+        with open(filename, 'r', encoding='utf-8', newline='', buffering=CSVProcessor.FILE_BUFFER_SIZE) as file:
+            CSVProcessor._advise_sequential(file)
+            reader = csv.reader(file)
+            columns = next(reader, [])
+            # пустые строки pyarrow тоже пропускает, поэтому и счёт прочитанных строк ведём без них
+            rows = filter(None, reader)
+            next(islice(rows, done_rows, done_rows), None)
+            while batch := list(islice(rows, batch_size)):
+                yield CSVProcessor._columns_from_rows(columns, batch)
+
+    @staticmethod
+    def _settle_types(filename: str, columns: List[str], batch_size: int = BATCH_SIZE) -> Dict[str, type]:
+        """Выводит типы колонок по всему файлу одним проходом, прежде чем обрабатывать его порциями.
+
+        Типы, уже записанные в файл-спутник, берутся из него без прохода по файлу.
+        """
+        header = CSVProcessor._read_header(filename)
+        for column in columns:
+            if column not in header:
+                raise ValueError(f"'{column}' not found in data columns")
+
+        schema = CSVProcessor._read_schema(filename)
+        column_types = {column: int for column in columns if column not in schema}
+        if column_types:
+            for text_columns in CSVProcessor._text_batches(filename, batch_size, list(column_types)):
+                for column in column_types:
+                    column_types[column] = CSVProcessor._typed_text(text_columns[column], column_types[column])[1]
+            schema.update({column: column_type.__name__ for column, column_type in column_types.items()})
+            CSVProcessor._write_schema(filename, schema)
+        return {column: CSVProcessor.TYPES_BY_NAME[schema[column]] for column in columns}
+
+    @staticmethod
+    def _downcast(arr: np.ndarray) -> np.ndarray:
+        """Сужает числовой массив до минимального dtype, вмещающего все значения без потерь"""
+        if not arr.size:
+            return arr
+
+        if arr.dtype.kind in 'iu':
+            low, high = arr.min(), arr.max()
+            for dtype in CSVProcessor.INT_DTYPES:
+                info = np.iinfo(dtype)
+                if info.min <= low and high <= info.max:
+                    return arr.astype(dtype, copy=False)
+            return arr
+
+        if arr.dtype == np.float64:
+            narrowed = arr.astype(np.float32)
+            if np.array_equal(narrowed, arr, equal_nan=True):
+                return narrowed
+
+        return arr
+
+    def _load_schema(self) -> Dict[str, str]:
+        if self._schema_path is None:
+            return {}
+
+        return {c: t for c, t in self._read_schema(self.filename).items() if c in self.columns}
+
+    def _save_schema(self) -> None:
+        self._write_schema(self.filename, self._schema)
+
+    @staticmethod
+    def _read_schema(filename: str) -> Dict[str, str]:
+        """Читает типы колонок из файла-спутника, если CSV не менялся с момента его записи"""
+        try:
+            with open(filename + CSVProcessor.SCHEMA_SUFFIX, 'r', encoding='utf-8') as file:
+                schema = json.load(file)
+            if schema['mtime_ns'] != os.stat(filename).st_mtime_ns:
+                return {}
+            return {c: t for c, t in schema['types'].items() if t in CSVProcessor.TYPES_BY_NAME}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            return {}
+
+    @staticmethod
+    def _write_schema(filename: str, types: Dict[str, str]) -> None:
+        schema_path = filename + CSVProcessor.SCHEMA_SUFFIX
+        tmp_path = f"{schema_path}.{os.getpid()}.tmp"
+        try:
+            schema = {'mtime_ns': os.stat(filename).st_mtime_ns, 'types': types}
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(schema, file)
+            os.replace(tmp_path, schema_path)
+        except OSError:
+            # файл-спутник только кэш, без него всё работает
+            pass
+
+    @property
+    def data(self) -> List[Dict[str, Any]]:
+        return self.to_rows()
+
+    @data.setter
+    def data(self, rows: List[Dict[str, Any]]) -> None:
+        self.columns_data = {c: np.array([row[c] for row in rows], dtype=object) for c in self.columns}
+        self.n_rows = len(rows)
+        self.cache_type = {i: None for i in self.columns}
+        self._schema_path = None
+        self._row_index = None
+
+    @property
+    def row_count(self) -> int:
+        return self.n_rows if self._row_index is None else len(self._row_index)
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """Собирает строки-словари из колонок, только для вывода"""
+        values = [self._view(self.columns_data[c]).tolist() for c in self.columns]
+        return [dict(zip(self.columns, row)) for row in zip(*values)]
+
+    def write_csv(self, sink: BinaryIO) -> None:
+        """Пишет текущие строки в CSV прямо из колонок, минуя строки-словари"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(self.columns)
+
+        if pa_csv is not None:
+            table = pa.table({c: self._csv_values(self._view(self.columns_data[c])) for c in self.columns})
+            # pyarrow берёт в кавычки либо все строки и заголовок, либо ничего, поэтому заголовок
+            # всегда пишет csv.writer, а pyarrow только таблицы без полей, требующих кавычек
+            if not self._needs_quoting(table):
+                sink.write(buffer.getvalue().encode('utf-8'))
+                pa_csv.write_csv(table, sink, pa_csv.WriteOptions(include_header=False, quoting_style='none'))
+                return
+
+        for start in range(0, self.row_count, self.BATCH_SIZE):
+            index = np.arange(start, min(start + self.BATCH_SIZE, self.row_count))
+            if self._row_index is not None:
+                index = self._row_index[index]
+            writer.writerows(zip(*(self.columns_data[c][index].tolist() for c in self.columns)))
+            sink.write(buffer.getvalue().encode('utf-8'))
+            buffer.seek(0)
+            buffer.truncate()
+        sink.write(buffer.getvalue().encode('utf-8'))
+
+    @staticmethod
+    def _csv_values(arr: np.ndarray) -> np.ndarray:
+        """Дробные числа переводит в текст так же, как csv.writer (repr): pyarrow пишет 100 вместо 100.0"""
+        if arr.dtype.kind == 'f':
+            # float32 сначала расширяем: csv.writer печатает значение, уже приведённое к float64
+            return arr.astype(np.float64).astype(str)
+        return arr
+
+    def _needs_quoting(self, table: Any) -> bool:
+        """Есть ли в таблице поля, которые csv.writer взял бы в кавычки"""
+        if any(
+            pc.any(pc.match_substring_regex(column, self.QUOTED_CHARS)).as_py()
+            for column in table.columns if pa.types.is_string(column.type)
+        ):
+            return True
+
+        # пустое единственное поле csv.writer пишет как "", чтобы строка не выглядела пустой
+        if table.num_columns == 1:
+            column = table.column(0)
+            return column.null_count > 0 or (pa.types.is_string(column.type) and pc.any(pc.equal(column, '')).as_py())
+        return False
 
     def _find_column_type(self, column: str) -> type:
         if self.cache_type[column] is not None:
             return self.cache_type[column]
 
+        arr = self.columns_data[column]
+        if arr.dtype.kind in 'iu':
+            self.cache_type[column] = int
+            return int
+        if arr.dtype.kind == 'f':
+            self.cache_type[column] = float
+            return float
+
         has_float = False
-        for row in self.data:
-            value = row[column].strip()
+        for item in arr[:self.TYPE_SAMPLE_SIZE]:
+            value = str(item).strip()
             try:
                 float(value)
                 if '.' in value:
@@ -45,46 +399,178 @@ class CSVProcessor:
         self.cache_type[column] = float if has_float else int
         return self.cache_type[column]
 
+    def _typed_column(self, column: str) -> np.ndarray:
+        """Приводит колонку к типу, выведенному по выборке; при ошибке расширяет тип int -> float -> str"""
+        column_type = self._find_column_type(column)
+        arr = self.columns_data[column]
+        if arr.dtype == object:
+            arr, column_type = self._typed_text(arr, column_type)
+            self.cache_type[column] = column_type
+        self.columns_data[column] = arr
+
+        if self._schema_path is not None and self._schema.get(column) != column_type.__name__:
+            self._schema[column] = column_type.__name__
+            self._save_schema()
+        return arr
+
+    def _view(self, arr: np.ndarray) -> np.ndarray:
+        return arr if self._row_index is None else arr[self._row_index]
+
+    def _selected(self, arr: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        """Выбирает строки по маске поверх текущего индекса одной выборкой, без промежуточной копии"""
+        return arr[mask] if self._row_index is None else arr[self._row_index[mask]]
+
     def _validate_column(self, column: str) -> None:
         if column not in self.columns:
             raise ValueError(f"'{column}' not found in data columns")
 
-    def filter_data(self, column: str, operator: str, value: str) -> List[Dict[str, str]]:
+    def _validate_aggregation(self, column: str, function: str) -> None:
         self._validate_column(column)
 
-        result = []
-        column_type = self._find_column_type(column)
-        typed_value = column_type(value)
+        if function not in self.AGG_CODES:
+            raise ValueError(f"Unsupported function: {function}")
 
-        for row in self.data:
-            item = column_type(row[column])
-            if CSVProcessor.OPERATORS[operator](item, typed_value):
-                result.append(row)
+        self._typed_column(column)
+        if self._find_column_type(column) == str:
+            raise ValueError(f"Aggregation is not supported for text columns")
 
-        return result
+    def _filter_mask(self, conditions: List[Tuple[str, str, str]]) -> np.ndarray:
+        """Строит маску по условиям, объединённым через И"""
+        operands = []
+        for column, operator, value in conditions:
+            self._validate_column(column)
+            arr = self._view(self._typed_column(column))
+            typed_value = self._find_column_type(column)(value)
+            if arr.dtype.kind == 'f':
+                # сравниваем в float64: иначе numpy округлит значение до float32 суженной колонки
+                typed_value = np.float64(typed_value)
+            operands.append((arr, operator, typed_value))
+
+        if len(operands) > 1 and ne is not None and all(arr.dtype.kind in 'if' for arr, _, _ in operands):
+            local_dict = {}
+            clauses = []
+            for i, (arr, operator, value) in enumerate(operands):
+                local_dict[f'c{i}'] = arr
+                local_dict[f'v{i}'] = value
+                clauses.append(f"(c{i} {self.NUMEXPR_OPS[operator]} v{i})")
+            return ne.evaluate(' & '.join(clauses), local_dict=local_dict)
+
+        mask = None
+        for arr, operator, value in operands:
+            condition_mask = filter_mask(arr, OP_CODES[operator], value)
+            mask = condition_mask if mask is None else mask & condition_mask
+        return mask
+
+    def _apply_filter(self, conditions: List[Tuple[str, str, str]]) -> None:
+        positions = np.flatnonzero(self._filter_mask(conditions))
+        self._row_index = positions if self._row_index is None else self._row_index[positions]
+
+    def filter_where(self, conditions: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+        self._apply_filter(conditions)
+        return self.to_rows()
+
+    def filter_data(self, column: str, operator: str, value: str) -> List[Dict[str, Any]]:
+        return self.filter_where([(column, operator, value)])
+
+    @classmethod
+    def stream_filter(cls, filename: str, conditions: List[Tuple[str, str, str]],
+                      batch_size: int = BATCH_SIZE) -> 'CSVProcessor':
+        """Фильтрует файл порциями и возвращает процессор только с подходящими строками"""
+        if not os.path.isfile(filename):
+            # канал нельзя прочитать дважды, а порциям нужен предварительный проход для вывода типов
+            processor = cls(filename)
+            processor._apply_filter(conditions)
+            return processor
+
+        column_types = cls._settle_types(filename, [column for column, _, _ in conditions], batch_size)
+        parts = []
+        for columns_data in cls.iter_batches(filename, batch_size, column_types):
+            batch = cls(filename, columns_data, column_types)
+            positions = np.flatnonzero(batch._filter_mask(conditions))
+            parts.append({c: arr[positions] for c, arr in batch.columns_data.items()})
+
+        if not parts:
+            return cls(filename, {c: np.array([], dtype=object) for c in cls._read_header(filename)})
+        return cls(filename, {c: np.concatenate([part[c] for part in parts]) for c in parts[0]}, column_types)
 
     def aggregate_data(self, column: str, function: str) -> Union[int, float]:
-        self._validate_column(column)
+        self._validate_aggregation(column, function)
+
+        values = self._view(self._typed_column(column))
+        return self._reduce(values, function)
+
+    def filter_aggregate(self, conditions: List[Tuple[str, str, str]],
+                         column: str, function: str) -> Union[int, float]:
+        """Фильтрует и агрегирует за один проход, не собирая промежуточных строк"""
+        self._validate_aggregation(column, function)
+
+        mask = self._filter_mask(conditions)
+        values = self._selected(self._typed_column(column), mask)
+        return self._reduce(values, function)
 
-        if function not in self.AGGREGATORS:
+    @classmethod
+    def stream_aggregate(cls, filename: str, conditions: List[Tuple[str, str, str]],
+                         column: str, function: str, batch_size: int = BATCH_SIZE) -> Union[int, float]:
+        """Агрегирует файл порциями: для avg копит сумму и количество, для min/max текущий экстремум"""
+        if not os.path.isfile(filename):
+            processor = cls(filename)
+            if conditions:
+                return processor.filter_aggregate(conditions, column, function)
+            return processor.aggregate_data(column, function)
+
+        if function not in cls.AGG_CODES:
             raise ValueError(f"Unsupported function: {function}")
 
-        column_type = self._find_column_type(column)
+        column_types = cls._settle_types(filename, [c for c, _, _ in conditions] + [column], batch_size)
+        total, count, result = 0, 0, None
+        for columns_data in cls.iter_batches(filename, batch_size, column_types):
+            batch = cls(filename, columns_data, column_types)
+            batch._validate_aggregation(column, function)
 
-        if column_type == str:
-            raise ValueError(f"Aggregation is not supported for text columns")
+            values = batch._typed_column(column)
+            if conditions:
+                values = values[batch._filter_mask(conditions)]
+            if not values.size:
+                continue
+
+            if function == 'avg':
+                total += values.sum(dtype=np.float64 if values.dtype.kind == 'f' else np.int64).item()
+                count += values.size
+            else:
+                value = batch._reduce(values, function)
+                result = value if result is None else (min if function == 'min' else max)(result, value)
+
+        if function == 'avg':
+            if not count:
+                raise ValueError("No data to aggregate")
+            return total / count
 
-        values = [column_type(row[column]) for row in self.data]
-        return self.AGGREGATORS[function](values)
+        if result is None:
+            raise ValueError("No data to aggregate")
+        return result
+
+    def _reduce(self, values: np.ndarray, function: str) -> Union[int, float]:
+        if not values.size:
+            raise ValueError("No data to aggregate")
+
+        return self.AGG_NP[self.AGG_CODES[function]](values).item()
 
-    def sort_data(self, column: str, direction: str = 'asc') -> List[Dict[str, str]]:
+    def sort_data(self, column: str, direction: str = 'asc') -> List[Dict[str, Any]]:
         """Сортирует данные по указанной колонке"""
+        self.order_by(column, direction)
+        return self.to_rows()
+
+    def order_by(self, column: str, direction: str = 'asc') -> None:
+        """Упорядочивает строки по колонке, не собирая строки-словари"""
         self._validate_column(column)
 
         if direction not in ['asc', 'desc']:
             raise ValueError(f"Sort direction must be 'asc' or 'desc'")
 
-        column_type = self._find_column_type(column)
-        reverse = direction == 'desc'
-
-        return sorted(self.data, key=lambda row: column_type(row[column]), reverse=reverse)
+        arr = self._view(self._typed_column(column))
+        if direction == 'desc':
+            # сортируем развёрнутый массив, чтобы равные значения сохранили исходный порядок
+            order = (len(arr) - 1) - np.argsort(arr[::-1], kind='stable')[::-1]
+        else:
+            order = np.argsort(arr, kind='stable')
+        self._row_index = order if self._row_index is None else self._row_index[order]
@@ -1,43 +1,130 @@
+import io
+import numpy as np
 import pytest
 import tempfile
+import threading
 import os
+import subprocess
 import sys
 from unittest.mock import patch
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from processor import CSVProcessor
-from main import parse_conditions, main
+import processor as processor_module
+from main import parse_conditions, parse_where, main
+import kernels
+
+
+@pytest.fixture(params=[True, False], ids=['pyarrow', 'csv'])
+def use_pyarrow(request):
+    with patch('processor.pa_csv', processor_module.pa_csv if request.param else None):
+        yield request.param
+
+
+@pytest.fixture
+def make_csv_file():
+    paths = []
+
+    def make(content):
+        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv') as f:
+            f.write(content)
+        paths.append(f.name)
+        return f.name
+
+    yield make
+    for path in paths:
+        for leftover in (path, path + CSVProcessor.SCHEMA_SUFFIX):
+            if os.path.exists(leftover):
+                os.unlink(leftover)
 
 
 class TestCSVProcessor:
 
     @pytest.fixture
-    def sample_csv_file(self):
-        content = """name,brand,price,rating
+    def sample_csv_file(self, make_csv_file):
+        return make_csv_file("""name,brand,price,rating
 iphone 15 pro,apple,999,4.9
 galaxy s23 ultra,samsung,1199,4.8
 redmi note 12,xiaomi,199,4.6
-poco x5 pro,xiaomi,299,4.4"""
-
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv') as f:
-            f.write(content)
-        yield f.name
-        os.unlink(f.name)
+poco x5 pro,xiaomi,299,4.4""")
 
     def test_load_csv_file(self, sample_csv_file):
         processor = CSVProcessor(sample_csv_file)
 
         assert len(processor.data) == 4
+        assert processor.n_rows == 4
         assert processor.columns == ['name', 'brand', 'price', 'rating']
         assert processor.data[0]['name'] == 'iphone 15 pro'
 
     def test_load_csv_static_method(self, sample_csv_file):
         data = CSVProcessor._load_csv(sample_csv_file)
 
-        assert len(data) == 4
-        assert data[0]['name'] == 'iphone 15 pro'
-        assert data[0]['brand'] == 'apple'
+        assert len(data['name']) == 4
+        assert data['name'][0] == 'iphone 15 pro'
+        assert data['brand'][0] == 'apple'
+
+    def test_load_csv_without_pyarrow(self, sample_csv_file):
+        with patch('processor.pa_csv', None):
+            processor = CSVProcessor(sample_csv_file)
+
+        assert processor.columns == ['name', 'brand', 'price', 'rating']
+        assert processor._find_column_type('price') == int
+        assert processor._find_column_type('rating') == float
+        assert processor.aggregate_data('price', 'max') == 1199
+
+    def test_load_csv_ragged_rows_without_pyarrow(self, make_csv_file):
+        path = make_csv_file("name,price\nmouse,25\n\ndesk\nchair,150,extra\n")
+
+        with patch('processor.pa_csv', None):
+            data = CSVProcessor._load_csv(path)
+
+        assert data['name'].tolist() == ['mouse', 'desk', 'chair']
+        assert data['price'].tolist() == ['25', None, '150']
+
+    def test_load_csv_ragged_rows(self, make_csv_file, use_pyarrow):
+        rows = [f"item {i},{i}" for i in range(30)] + ["desk", "chair,150,extra", "", "lamp,7"]
+        path = make_csv_file("name,price\n" + "\n".join(rows) + "\n")
+
+        with patch.object(CSVProcessor, 'READ_BLOCK_SIZE', 64):
+            processor = CSVProcessor(path)
+            streamed = CSVProcessor.stream_filter(path, [('name', '>', '')], batch_size=8)
+
+        assert processor.n_rows == streamed.row_count == 33
+        assert processor.filter_data('name', '=', 'chair') == [{'name': 'chair', 'price': '150'}]
+        assert [row['name'] for row in streamed.to_rows()[-3:]] == ['desk', 'chair', 'lamp']
+
+    def test_short_row_makes_column_text(self, make_csv_file):
+        rows = [f"item {i},{i}" for i in range(CSVProcessor.TYPE_SAMPLE_SIZE)] + ["short"]
+        path = make_csv_file("name,price\n" + "\n".join(rows) + "\n")
+
+        with patch('processor.pa_csv', None):
+            ordered = CSVProcessor(path).sort_data('price', 'desc')
+            with pytest.raises(ValueError, match="Aggregation is not supported for text columns"):
+                CSVProcessor(path).aggregate_data('price', 'max')
+            with pytest.raises(ValueError, match="Aggregation is not supported for text columns"):
+                CSVProcessor.stream_aggregate(path, [], 'price', 'max', batch_size=16)
+            assert CSVProcessor(path).sort_data('price', 'desc') == ordered
+
+        assert ordered[0] == {'name': 'item 9', 'price': '9'}
+        assert ordered[-1] == {'name': 'short', 'price': ''}
+
+    def test_advise_sequential_ignores_pipes(self):
+        read_fd, write_fd = os.pipe()
+        try:
+            with os.fdopen(read_fd, 'r') as file:
+                CSVProcessor._advise_sequential(file)
+        finally:
+            os.close(write_fd)
+
+    @pytest.mark.parametrize("use_pyarrow, price, rating", [(True, 199, 4.6), (False, '199', '4.6')],
+                             indirect=['use_pyarrow'])
+    def test_to_rows(self, sample_csv_file, use_pyarrow, price, rating):
+        processor = CSVProcessor(sample_csv_file)
+
+        rows = processor.to_rows()
+        assert len(rows) == 4
+        assert rows[2] == {'name': 'redmi note 12', 'brand': 'xiaomi', 'price': price, 'rating': rating}
 
     def test_load_nonexistent_file(self):
         with pytest.raises(FileNotFoundError):
@@ -55,6 +142,60 @@ poco x5 pro,xiaomi,299,4.4"""
         assert processor._find_column_type('price') == int
         assert processor._find_column_type('rating') == float
 
+    def test_column_type_widened_after_sample(self, make_csv_file):
+        rows = [f"{i},item {i}" for i in range(CSVProcessor.TYPE_SAMPLE_SIZE)] + ["7.5,tail", "x,tail"]
+        path = make_csv_file("amount,label\n" + "\n".join(rows))
+
+        with patch('processor.pa_csv', None):
+            processor = CSVProcessor(path)
+
+        assert processor._find_column_type('amount') == int
+        with pytest.raises(ValueError, match="Aggregation is not supported for text columns"):
+            processor.aggregate_data('amount', 'max')
+        assert processor._find_column_type('amount') == str
+        assert CSVProcessor._read_schema(path) == {'amount': 'str'}
+
+    def test_schema_sidecar_reused_between_runs(self, sample_csv_file):
+        with patch('processor.pa_csv', None):
+            CSVProcessor(sample_csv_file).aggregate_data('rating', 'max')
+            CSVProcessor(sample_csv_file).filter_data('brand', '=', 'apple')
+
+            processor = CSVProcessor(sample_csv_file)
+            assert processor.cache_type == {'name': None, 'brand': str, 'price': None, 'rating': float}
+
+            stat = os.stat(sample_csv_file)
+            os.utime(sample_csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+            processor = CSVProcessor(sample_csv_file)
+            assert processor.cache_type == {'name': None, 'brand': None, 'price': None, 'rating': None}
+
+    def test_numeric_columns_downcast(self, sample_csv_file, use_pyarrow):
+        processor = CSVProcessor(sample_csv_file)
+
+        assert processor.filter_data('price', '>', '1000')[0]['name'] == 'galaxy s23 ultra'
+        assert processor.columns_data['price'].dtype == np.uint16
+
+    def test_downcast_keeps_lossy_floats(self):
+        assert CSVProcessor._downcast(np.array([0.5, 2.25])).dtype == np.float32
+        assert CSVProcessor._downcast(np.array([4.9, 4.8])).dtype == np.float64
+        assert CSVProcessor._downcast(np.array([-5, 300])).dtype == np.int16
+
+    @pytest.mark.parametrize("use_numexpr", [True, False])
+    @pytest.mark.parametrize("operator, value, expected", [
+        ('<', '2.2500000001', [0.5, 2.25]),
+        ('>', '0.4999999999', [0.5, 2.25]),
+        ('=', '0.5000000001', []),
+    ])
+    def test_filter_narrowed_floats_beyond_float32_precision(self, make_csv_file, use_pyarrow, use_numexpr,
+                                                             operator, value, expected):
+        path = make_csv_file("x,y\n0.5,1\n2.25,1\n")
+
+        with patch('processor.ne', processor_module.ne if use_numexpr else None):
+            processor = CSVProcessor(path)
+            result = processor.filter_where([('x', operator, value), ('y', '=', '1')])
+
+        assert processor.columns_data['x'].dtype == np.float32
+        assert [row['x'] for row in result] == expected
+
     def test_filter_data_equals(self, sample_csv_file):
         processor = CSVProcessor(sample_csv_file)
 
@@ -76,6 +217,15 @@ poco x5 pro,xiaomi,299,4.4"""
         assert len(result) == 2  # redmi и poco
         assert all(float(row['rating']) < 4.7 for row in result)
 
+    def test_filter_narrows_following_operations(self, sample_csv_file):
+        processor = CSVProcessor(sample_csv_file)
+
+        processor.filter_data('brand', '=', 'xiaomi')
+        assert processor.aggregate_data('price', 'max') == 299
+
+        result = processor.sort_data('price', 'desc')
+        assert [row['name'] for row in result] == ['poco x5 pro', 'redmi note 12']
+
     def test_filter_invalid_column(self, sample_csv_file):
         processor = CSVProcessor(sample_csv_file)
 
@@ -95,6 +245,18 @@ poco x5 pro,xiaomi,299,4.4"""
         assert processor.aggregate_data('price', 'min') == 199
         assert processor.aggregate_data('price', 'max') == 1199
 
+    def test_aggregate_avg_accumulates_in_float64(self, sample_csv_file):
+        processor = CSVProcessor(sample_csv_file)
+        values = np.array([16777216.0, 1.0, 1.0], dtype=np.float32)
+
+        assert processor._reduce(values, 'avg') == 16777218 / 3
+
+    def test_filter_aggregate_after_sort(self, sample_csv_file):
+        processor = CSVProcessor(sample_csv_file)
+
+        processor.sort_data('price', 'desc')
+        assert processor.filter_aggregate([('brand', '=', 'xiaomi')], 'rating', 'max') == 4.6
+
     def test_aggregate_text_column_error(self, sample_csv_file):
         processor = CSVProcessor(sample_csv_file)
 
@@ -107,6 +269,62 @@ poco x5 pro,xiaomi,299,4.4"""
         with pytest.raises(ValueError, match="Unsupported function"):
             processor.aggregate_data('price', 'median')
 
+    def test_aggregate_after_empty_filter(self, sample_csv_file):
+        processor = CSVProcessor(sample_csv_file)
+
+        processor.filter_data('price', '>', '5000')
+        with pytest.raises(ValueError, match="No data to aggregate"):
+            processor.aggregate_data('price', 'avg')
+
+    def test_filter_aggregate(self, sample_csv_file):
+        processor = CSVProcessor(sample_csv_file)
+
+        assert processor.filter_aggregate([('brand', '=', 'xiaomi')], 'price', 'avg') == (199 + 299) / 2
+        assert processor.filter_aggregate([('price', '>', '500')], 'rating', 'min') == 4.8
+
+    def test_filter_aggregate_no_matches(self, sample_csv_file):
+        processor = CSVProcessor(sample_csv_file)
+
+        with pytest.raises(ValueError, match="No data to aggregate"):
+            processor.filter_aggregate([('price', '>', '5000')], 'price', 'max')
+
+    @pytest.mark.parametrize("use_numexpr", [True, False])
+    def test_filter_where_chained(self, sample_csv_file, use_numexpr):
+        processor = CSVProcessor(sample_csv_file)
+
+        with patch('processor.ne', processor_module.ne if use_numexpr else None):
+            result = processor.filter_where([('price', '>', '250'), ('rating', '<', '4.85')])
+
+        assert [row['name'] for row in result] == ['galaxy s23 ultra', 'poco x5 pro']
+
+    def test_filter_where_mixed_types(self, sample_csv_file):
+        processor = CSVProcessor(sample_csv_file)
+
+        result = processor.filter_where([('brand', '=', 'xiaomi'), ('price', '<', '250')])
+        assert [row['name'] for row in result] == ['redmi note 12']
+
+    def test_iter_batches(self, sample_csv_file, use_pyarrow):
+        batches = list(CSVProcessor.iter_batches(sample_csv_file, batch_size=3))
+
+        assert [len(batch['name']) for batch in batches] == [3, 1]
+        assert batches[1]['name'][0] == 'poco x5 pro'
+
+    @pytest.mark.parametrize("function, expected", [('avg', (999 + 1199 + 299) / 3), ('min', 299), ('max', 1199)])
+    def test_stream_aggregate(self, sample_csv_file, function, expected):
+        conditions = [('price', '>', '250')]
+
+        assert CSVProcessor.stream_aggregate(sample_csv_file, conditions, 'price', function, batch_size=2) == expected
+
+    def test_stream_aggregate_no_matches(self, sample_csv_file):
+        with pytest.raises(ValueError, match="No data to aggregate"):
+            CSVProcessor.stream_aggregate(sample_csv_file, [('price', '>', '5000')], 'price', 'avg', batch_size=2)
+
+    def test_stream_filter(self, sample_csv_file):
+        processor = CSVProcessor.stream_filter(sample_csv_file, [('rating', '<', '4.85')], batch_size=3)
+
+        assert [row['name'] for row in processor.to_rows()] == ['galaxy s23 ultra', 'redmi note 12', 'poco x5 pro']
+        assert processor.sort_data('price')[0]['name'] == 'redmi note 12'
+
     def test_sort_data_asc(self, sample_csv_file):
         processor = CSVProcessor(sample_csv_file)
 
@@ -121,6 +339,87 @@ poco x5 pro,xiaomi,299,4.4"""
         prices = [int(row['price']) for row in result]
         assert prices == [1199, 999, 299, 199]
 
+    def test_sort_data_desc_is_stable(self, sample_csv_file):
+        processor = CSVProcessor(sample_csv_file)
+
+        result = processor.sort_data('brand', 'desc')
+        assert [row['name'] for row in result] == [
+            'redmi note 12', 'poco x5 pro', 'galaxy s23 ultra', 'iphone 15 pro'
+        ]
+
+    def test_write_csv(self, sample_csv_file, use_pyarrow):
+        processor = CSVProcessor(sample_csv_file)
+        processor.filter_data('brand', '=', 'xiaomi')
+        processor.order_by('price', 'desc')
+        sink = io.BytesIO()
+
+        with patch.object(CSVProcessor, 'BATCH_SIZE', 1):
+            processor.write_csv(sink)
+
+        assert sink.getvalue() == b"name,brand,price,rating\npoco x5 pro,xiaomi,299,4.4\nredmi note 12,xiaomi,199,4.6\n"
+
+    @pytest.mark.parametrize("name, expected_name", [('lamp', b'lamp'), ('lamp, xl', b'"lamp, xl"')])
+    def test_write_csv_floats(self, use_pyarrow, name, expected_name):
+        processor = CSVProcessor('-', {
+            'name': np.array([name, 'desk', 'cable'], dtype=object),
+            'rating': np.array([4.0, 1e-7, 0.1]),
+            'weight': np.array([0.5, 2.0, 100.0], dtype=np.float32),
+        })
+        sink = io.BytesIO()
+        processor.write_csv(sink)
+
+        assert sink.getvalue() == (b'name,rating,weight\n' + expected_name + b',4.0,0.5\n'
+                                   b'desk,1e-07,2.0\ncable,0.1,100.0\n')
+
+    def test_write_csv_quotes_only_where_needed(self, use_pyarrow):
+        processor = CSVProcessor('-', {
+            'name': np.array(['desk, oak', 'lamp "xl"', None], dtype=object),
+            'price': np.array([150, 25, 7], dtype=np.uint8),
+        })
+        sink = io.BytesIO()
+        processor.write_csv(sink)
+
+        assert sink.getvalue() == b'name,price\n"desk, oak",150\n"lamp ""xl""",25\n,7\n'
+
+
+class TestKernels:
+
+    @pytest.mark.parametrize("operator", ['>', '<', '='])
+    def test_numba_filters_match_numpy(self, operator):
+        pytest.importorskip('numba')
+        arr = np.array([5, 1, 3, 3, 9], dtype=np.int64)
+
+        with patch('kernels.NUMBA_MIN_SIZE', 0):
+            mask = kernels.filter_mask(arr, kernels.OP_CODES[operator], 3)
+
+        expected = {'>': arr > 3, '<': arr < 3, '=': arr == 3}[operator]
+        assert mask.tolist() == expected.tolist()
+
+    @pytest.mark.parametrize("operator, expected", [('>', False), ('<', True), ('=', False)])
+    def test_value_beyond_int64_falls_back_to_numpy(self, operator, expected):
+        arr = np.array([5, 1, 3], dtype=np.int64)
+
+        with patch('kernels.NUMBA_MIN_SIZE', 0):
+            mask = kernels.filter_mask(arr, kernels.OP_CODES[operator], 99999999999999999999)
+
+        assert mask.tolist() == [expected] * 3
+
+    def test_specialized_filter_cached_per_dtype_and_operator(self):
+        arr = np.array([1.5, 2.5], dtype=np.float32)
+
+        assert kernels.filter_mask(arr, kernels.OP_CODES['='], 2.5).tolist() == [False, True]
+        assert kernels._specialized_filter(arr.dtype, 2) is kernels._FILTER_CACHE[(arr.dtype.str, 2)]
+        assert kernels._specialized_filter(arr.dtype, 2) is not kernels._specialized_filter(arr.dtype, 0)
+
+    def test_numba_imported_only_for_large_arrays(self):
+        src = os.path.join(os.path.dirname(__file__), '..', 'src')
+        code = ("import sys, numpy as np, kernels, processor\n"
+                "kernels.filter_mask(np.arange(10), kernels.OP_CODES['>'], 3)\n"
+                "print('numba' in sys.modules)")
+        result = subprocess.run([sys.executable, '-c', code], cwd=src, capture_output=True, text=True, check=True)
+
+        assert result.stdout.strip() == 'False'
+
 
 class TestMainModule:
     @pytest.mark.parametrize(
@@ -140,9 +439,21 @@ class TestMainModule:
         assert operator == '='
         assert value == '100'
 
-    def test_parse_conditions_invalid_format(self):
+    def test_parse_where_chained(self):
+        assert parse_where('price>100 & rating>4.5') == [('price', '>', '100'), ('rating', '>', '4.5')]
+
+    @pytest.mark.parametrize("where, expected", [
+        ('brand=AT&T', [('brand', '=', 'AT&T')]),
+        ('brand=AT&T & price>100', [('brand', '=', 'AT&T'), ('price', '>', '100')]),
+        ('name=R&D&Co&rating>4', [('name', '=', 'R&D&Co'), ('rating', '>', '4')]),
+    ])
+    def test_parse_where_ampersand_in_value(self, where, expected):
+        assert parse_where(where) == expected
+
+    @pytest.mark.parametrize("condition", ['invalid_condition', '=100', 'price>'])
+    def test_parse_conditions_invalid_format(self, condition):
         with pytest.raises(ValueError, match="Invalid condition format"):
-            parse_conditions('invalid_condition')
+            parse_conditions(condition)
 
     @patch('sys.argv', ['main.py', 'test.csv'])
     def test_main_no_parameters(self):
@@ -150,6 +461,15 @@ class TestMainModule:
             main()
             mock_help.assert_called_once()
 
+    def test_main_large_result_written_as_csv(self, make_csv_file, capsys, use_pyarrow):
+        path = make_csv_file('name,price\na,1\n"b, c",2\nd,3\n')
+
+        with patch('sys.argv', ['main.py', path, '--order-by', 'price=desc']), \
+                patch('main.LARGE_RESULT_ROWS', 2):
+            main()
+
+        assert capsys.readouterr().out == 'name,price\nd,3\n"b, c",2\na,1\n'
+
     @patch('sys.argv', ['main.py', 'nonexistent.csv', '--where', 'price>100'])
     @patch('builtins.print')
     def test_main_file_not_found(self, mock_print):
@@ -205,3 +525,75 @@ chair,furniture,150,8"""
         avg_price = processor.aggregate_data('price', 'avg')
         expected = (1500 + 25) / 2
         assert avg_price == expected
+
+    def test_true_false_values_stay_text(self, make_csv_file, use_pyarrow):
+        path = make_csv_file("name,active\nlamp,true\ndesk,false\n")
+
+        processor = CSVProcessor(path)
+        result = processor.filter_data('active', '=', 'true')
+
+        assert result == [{'name': 'lamp', 'active': 'true'}]
+
+    def test_padded_numbers_stay_numeric(self, make_csv_file, use_pyarrow):
+        path = make_csv_file("name,price\na, 150\nb,20 \nc,+5\nd,1_000\n")
+
+        result = CSVProcessor(path).filter_data('price', '>', '100')
+
+        assert [row['name'] for row in result] == ['a', 'd']
+        assert CSVProcessor(path).aggregate_data('price', 'max') == 1000
+        assert CSVProcessor.stream_aggregate(path, [], 'price', 'min') == 5
+
+    def test_empty_numeric_cell_makes_column_text(self, make_csv_file, use_pyarrow):
+        path = make_csv_file("name,qty\nlamp,3\ndesk,\n")
+
+        processor = CSVProcessor(path)
+        with pytest.raises(ValueError, match="Aggregation is not supported for text columns"):
+            processor.aggregate_data('qty', 'max')
+
+    def test_stream_filter_types_settled_before_batching(self, make_csv_file, use_pyarrow):
+        path = make_csv_file("name,code\na,10\nb,9\nc,A1\nd,100\n")
+
+        streamed = CSVProcessor.stream_filter(path, [('code', '>', '5')], batch_size=2).to_rows()
+        whole = CSVProcessor(path).filter_data('code', '>', '5')
+
+        assert [row['code'] for row in streamed] == ['9', 'A1']
+        assert streamed == whole
+
+    def test_stream_filter_widens_type_past_first_block(self, make_csv_file, use_pyarrow):
+        path = make_csv_file("code\n" + "\n".join(str(i) for i in range(10, 100)) + "\nA1\n")
+
+        with patch.object(CSVProcessor, 'READ_BLOCK_SIZE', 64):
+            result = CSVProcessor.stream_filter(path, [('code', '>', '9')], batch_size=10).to_rows()
+
+        assert [row['code'] for row in result] == [str(i) for i in range(90, 100)] + ['A1']
+
+    @pytest.mark.parametrize("argv", [['--where', 'price>100'], ['--aggregate', 'price=max']])
+    def test_main_streamed_run_reuses_schema_sidecar(self, make_csv_file, capsys, use_pyarrow, argv):
+        path = make_csv_file("name,price\nlamp,150\ndesk,300\n")
+
+        with patch('sys.argv', ['main.py', path] + argv):
+            main()
+            assert CSVProcessor._read_schema(path) == {'price': 'int'}
+
+            with patch.object(CSVProcessor, '_typed_text') as typed_text:
+                main()
+            typed_text.assert_not_called()
+
+        out = capsys.readouterr().out
+        assert 'error' not in out.lower()
+        assert out.count('300') == 2
+
+    @pytest.mark.parametrize("argv", [['--where', 'price>1'], ['--aggregate', 'price=max'], ['--order-by', 'price=desc']])
+    def test_main_reads_from_pipe(self, tmp_path, capsys, argv):
+        fifo = tmp_path / 'input.csv'
+        os.mkfifo(fifo)
+        writer = threading.Thread(target=fifo.write_text, args=("name,price\nlamp,1\ndesk,2\n",))
+        writer.start()
+
+        with patch('sys.argv', ['main.py', str(fifo)] + argv):
+            main()
+        writer.join()
+
+        out = capsys.readouterr().out
+        assert 'error' not in out.lower()
+        assert '2' in out